@@ -1,16 +1,38 @@
 import os
+import re
+import mmap
+import json
+import pickle
+import hashlib
+import struct
 import yaml
 import logging
 import argparse
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 import logging.handlers
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import threading
 import shutil
+import tempfile
 import sys
 from datetime import datetime
 
+# Prefer the libyaml-backed loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Worker processes are spawned: forking while the logging listener and queue
+# feeder threads run can deadlock the children
+MP_CONTEXT = multiprocessing.get_context('spawn')
+
+# Config cache files start with the source's (st_mtime_ns, st_size)
+CACHE_STAMP = struct.Struct('<qq')
+
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?B)\s*$', re.IGNORECASE)
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+
 
 @dataclass
 class MigrationContext:
@@ -28,15 +50,66 @@ class ConfigurationManager:
         self._validate_config()
 
     def _load_config(self) -> Dict[str, Any]:
-        """Load configuration from YAML file"""
+        """Load configuration from the pickle cache, or from YAML if the cache is stale"""
         try:
-            with open(self.config_file, 'r') as f:
-                config = yaml.safe_load(f)
+            source = os.stat(self.config_file)
+            stamp = (source.st_mtime_ns, source.st_size)
+        except OSError:
+            stamp = None
+        cache_file = config_cache_dir() / (
+            hashlib.sha256(os.path.abspath(self.config_file).encode()).hexdigest() + '.pickle')
+
+        if stamp is not None:
+            config = self._read_cache(cache_file, stamp)
+            if config is not None:
                 return config
+
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                config = yaml.load(f, Loader=YAML_LOADER)
         except Exception as e:
             print(f"Error loading configuration: {str(e)}")
             sys.exit(1)
 
+        if stamp is not None:
+            self._write_cache(cache_file, stamp, config)
+        return config
+
+    @staticmethod
+    def _read_cache(cache_file: Path, stamp: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """Return the cached configuration if it was built from exactly this source file"""
+        try:
+            with open(cache_file, 'rb') as f:
+                # Only unpickle a file nobody else could have written
+                if not is_private_file(os.fstat(f.fileno())):
+                    return None
+                header = f.read(CACHE_STAMP.size)
+                if len(header) != CACHE_STAMP.size or CACHE_STAMP.unpack(header) != stamp:
+                    return None
+                return pickle.load(f)
+        except Exception:
+            # Missing, unreadable or corrupt cache; fall back to the YAML source
+            return None
+
+    @staticmethod
+    def _write_cache(cache_file: Path, stamp: Tuple[int, int], config: Dict[str, Any]):
+        """Write parsed configuration and its source stamp to the pickle cache, ignoring failures"""
+        tmp_path = None
+        try:
+            cache_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(CACHE_STAMP.pack(*stamp))
+                pickle.dump(config, f, protocol=5)
+            os.replace(tmp_path, cache_file)
+        except (OSError, pickle.PicklingError):
+            # Unwritable cache directory or values that cannot be pickled; skip caching
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
     def _validate_config(self):
         """Validate configuration structure and required fields"""
         required_sections = ['paths', 'files', 'patterns', 'migration', 'logging']
@@ -44,23 +117,34 @@ class ConfigurationManager:
             if section not in self.config:
                 raise ValueError(f"Missing required configuration section: {section}")
 
-    def update_paths(self, base_dir: str):
-        """Update paths based on provided base directory"""
+    def update_paths(self, base_dir: Path):
+        """Update paths based on provided base directory, storing them as Path objects"""
+        base_dir = Path(base_dir)
         self.config['paths']['base_dir'] = base_dir
         for key, path in self.config['paths'].items():
             if key != 'base_dir':
-                self.config['paths'][key] = os.path.join(base_dir, path)
+                self.config['paths'][key] = base_dir / path
 
 class LoggingManager:
     """Manages logging configuration and setup"""
-    @staticmethod
-    def setup_logging(config: Dict[str, Any]) -> logging.Logger:
+    # Queue and listener behind the 'StrutsMigration' logger while logging is active
+    _log_queue = None
+    _listener: Optional[logging.handlers.QueueListener] = None
+
+    @classmethod
+    def setup_logging(cls, config: Dict[str, Any]) -> logging.Logger:
         """Configure and return logger based on configuration"""
         log_config = config['logging']
         log_file = log_config['file']      
         logger = logging.getLogger('StrutsMigration')
         logger.setLevel(getattr(logging, log_config['level']))
 
+        # Replace handlers left by an earlier setup instead of stacking new ones
+        cls.shutdown_logging(logger)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
         # File handler with rotation
         file_handler = logging.handlers.RotatingFileHandler(
             log_file,
@@ -72,110 +156,297 @@ class LoggingManager:
         # Console handler
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(logging.Formatter(log_config['format']))
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+
+        # Workers, including worker processes, only enqueue records; a single
+        # listener thread does the writes
+        cls._log_queue = MP_CONTEXT.Queue()
+        cls._listener = logging.handlers.QueueListener(cls._log_queue, file_handler, console_handler)
+        logger.addHandler(logging.handlers.QueueHandler(cls._log_queue))
+        cls._listener.start()
         return logger
 
+    @classmethod
+    def log_queue(cls):
+        """Return the queue worker processes should log to, or None if logging is shut down"""
+        return cls._log_queue
+
+    @classmethod
+    def shutdown_logging(cls, logger: logging.Logger):
+        """Flush queued records, stop the logging listener and detach its queue handler"""
+        if cls._listener is None:
+            return
+
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is cls._log_queue:
+                logger.removeHandler(handler)
+                handler.close()
+        cls._listener.stop()
+        for handler in cls._listener.handlers:
+            handler.close()
+        cls._log_queue.close()
+        cls._log_queue.join_thread()
+        cls._listener = None
+        cls._log_queue = None
+
 class PathManager:
     """Manages path operations and validations"""
     def __init__(self, context: MigrationContext):
         self.context = context
 
     def validate_paths(self):
-         """Validate existence of required paths"""
+        """Validate existence of required paths"""
         required_paths = [
             self.context.base_dir,
             self.context.base_dir / self.context.config['files']['pom'],
             self.context.base_dir / self.context.config['files']['struts_config']
         ]
 
+        # One listing per parent directory instead of a stat per path. A name
+        # missing from the listing is confirmed with exists(), which also covers
+        # case-insensitive filesystems and parents that cannot be listed.
+        names_by_parent = {}
         for path in required_paths:
-            if not path.exists():
+            if path == self.context.base_dir or path.name in ('', '.', '..'):
+                exists = path.exists()
+            else:
+                if path.parent not in names_by_parent:
+                    try:
+                        names_by_parent[path.parent] = set(os.listdir(path.parent))
+                    except OSError:
+                        names_by_parent[path.parent] = set()
+                exists = path.name in names_by_parent[path.parent] or path.exists()
+            if not exists:
                 raise ValueError(f"Required path does not exist: {path}")
 
-    def create_backup_directory(self):
-        """Create backup directory if enabled"""
-        if self.context.config['migration']['backup_enabled']:
-            self.context.backup_dir.mkdir(parents=True, exist_ok=True)
+    def create_backup_directory(self) -> Optional[Path]:
+        """Snapshot the project as hard links into a new timestamped backup directory.
+
+        Returns the snapshot directory, or None if backups are disabled.
+        """
+        if not self.context.config['migration']['backup_enabled']:
+            return None
+
+        # Each run gets its own snapshot, so earlier ones are never overwritten
+        snapshot_dir = self.context.backup_dir / datetime.now().strftime('%Y%m%d_%H%M%S')
+        if snapshot_dir.exists() and any(snapshot_dir.iterdir()):
+            raise ValueError(f"Backup directory is not empty: {snapshot_dir}")
+
+        skip_dir = os.path.abspath(self.context.backup_dir)
+
+        def ignore_backup(dir_path, names):
+            return [name for name in names
+                    if os.path.abspath(os.path.join(dir_path, name)) == skip_dir]
+
+        # Recreate symlinks as links so cycles and external trees are not followed
+        shutil.copytree(self.context.base_dir, snapshot_dir, symlinks=True, dirs_exist_ok=True,
+                        ignore=ignore_backup, copy_function=link_or_copy)
+        return snapshot_dir
 
 
 class FileProcessor:
     """Handles file processing and migration"""
     def __init__(self, context: MigrationContext):
         self.context = context
+        encoding = context.config.get('java', {}).get('encoding', 'utf-8')
+        # Compile rewrite rules once instead of per file
+        rewrites = context.config['patterns'].get('rewrites') or {}
+        self._java_rules = self._compile_rules(rewrites.get('java'), encoding)
+        self._xml_rules = self._compile_rules(rewrites.get('xml'), encoding)
+        self._jsp_rules = self._compile_rules(rewrites.get('jsp'), encoding)
+
+    @staticmethod
+    def _compile_rules(rules, encoding: str) -> List[Tuple[re.Pattern, bytes]]:
+        """Compile (pattern, replacement) pairs from configuration as bytes regexes"""
+        return [(re.compile(pattern.encode(encoding), re.MULTILINE), replacement.encode(encoding))
+                for pattern, replacement in rules or []]
 
     def process_files(self):
         """Process files according to configuration"""
         patterns = self.context.config['patterns']
         files_to_process = self._gather_files(patterns['include'], patterns['exclude'])      
+        if not files_to_process:
+            return
+
         batch_size = self.context.config['migration']['batch_size']
-        num_threads = self.context.config['migration']['parallel_threads']
+        cpus = available_cpus()
+        num_workers = min(self.context.config['migration']['parallel_threads'],
+                          len(cpus), len(files_to_process))
+
+        # Cap files in flight without a barrier between batches, keeping a few
+        # queued per worker so one slow file never leaves the others idle
+        in_flight = threading.BoundedSemaphore(max(batch_size, 3 * num_workers))
+        initargs = (
+            self.context.config,
+            self.context.base_dir,
+            self.context.backup_dir,
+            LoggingManager.log_queue(),
+            cpus,
+            MP_CONTEXT.Value('i', 0),
+        )
 
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            for i in range(0, len(files_to_process), batch_size):
-                batch = files_to_process[i:i + batch_size]
-                futures = [executor.submit(self._process_file, file) for file in batch]
-                for future in futures:
-                    try:
-                        future.result()
-                    except Exception as e:
-                        self.context.logger.error(f"Error processing file: {str(e)}")
+        # Rewriting is regex-bound, so use processes to get past the GIL
+        futures = []
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=MP_CONTEXT,
+                                 initializer=_init_worker, initargs=initargs) as executor:
+            for file in files_to_process:
+                in_flight.acquire()
+                future = executor.submit(_process_file_in_worker, file)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.context.logger.error(f"Error processing file: {str(e)}")
 
     def _gather_files(self, include_patterns, exclude_patterns):
         """Gather files based on include/exclude patterns"""
-        files = []
+        # Excludes match from the right, as Path.match did
+        exclude = compile_globs(exclude_patterns, anchored=False)
+        # Directories matched by an exclude ending in '/**' can never yield a file
+        prune = compile_globs([p[:-3] for p in exclude_patterns if p.endswith('/**')],
+                              anchored=False)
+
+        # The backup is a tree of hard links to project files; rewriting it
+        # would corrupt the snapshot, whatever the exclude patterns say
+        backup_dir = os.path.abspath(self.context.backup_dir)
+        real_backup_dir = os.path.realpath(self.context.backup_dir)
+        real_base_dir = os.path.realpath(self.context.base_dir)
+
+        def in_backup(path) -> bool:
+            return is_within(os.path.abspath(path), backup_dir)
+
+        # Files are keyed by real path, so a symlink and its target are only
+        # rewritten once; links resolving outside the project are not followed
+        files = {}
+
+        def add(path: Path, real_path: str):
+            if not is_within(real_path, real_base_dir) or is_within(real_path, real_backup_dir):
+                self.context.logger.warning(
+                    f"Skipping {path}: symlink resolves outside the project or into the backup")
+                return
+            files.setdefault(real_path, path)
+
+        patterns_by_prefix = {}
         for pattern in include_patterns:
-            files.extend(self.context.base_dir.glob(pattern))
-       
-
-        # Apply exclusion patterns
-        for pattern in exclude_patterns:
-            files = [f for f in files if not f.match(pattern)]
-            
-        return files
+            if not has_glob_magic(pattern):
+                path = self.context.base_dir / pattern
+                if path.is_file() and not exclude.fullmatch(pattern) and not in_backup(path):
+                    add(path, os.path.realpath(path))
+                continue
+            patterns_by_prefix.setdefault(glob_literal_prefix(pattern), []).append(pattern)
+
+        # Walk each literal prefix once for all of its patterns; a walk from a
+        # prefix also covers patterns whose prefix lies beneath it
+        walks = {}
+        for prefix in sorted(patterns_by_prefix):
+            root = next((r for r in walks if prefix.startswith(r)), prefix)
+            walks.setdefault(root, []).extend(patterns_by_prefix[prefix])
+
+        for prefix, patterns in walks.items():
+            root = self.context.base_dir / prefix
+            if not root.is_dir() or in_backup(root):
+                continue
+            include = compile_globs(patterns)
+            for path, rel_path, is_link in self._walk(root, prefix, include, exclude, prune, in_backup):
+                # Directory symlinks are never followed, so only a file link needs resolving
+                real_path = os.path.realpath(path) if is_link \
+                    else os.path.join(real_base_dir, os.path.normpath(rel_path))
+                add(path, real_path)
+
+        return list(files.values())
+
+    def _walk(self, root: Path, rel_root: str, include, exclude, prune, skip_dir):
+        """Yield (path, relative path, is symlink) for files under root whose relative path matches"""
+        stack = [(str(root), rel_root)]
+        while stack:
+            dir_path, rel_dir = stack.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    listing = list(entries)
+            except OSError as e:
+                # Skip unreadable directories like Path.glob does, rather than failing the run
+                self.context.logger.warning(f"Skipping unreadable directory {dir_path}: {str(e)}")
+                continue
+
+            for entry in listing:
+                rel_path = rel_dir + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not prune.fullmatch(rel_path) and not skip_dir(entry.path):
+                        stack.append((entry.path, rel_path + '/'))
+                elif entry.is_file() and include.fullmatch(rel_path) \
+                        and not exclude.fullmatch(rel_path):
+                    yield Path(entry.path), rel_path, entry.is_symlink()
 
     def _process_file(self, file_path: Path):
         """Process individual file based on type"""
+        handler = self._HANDLERS.get(file_path.suffix)
+        if handler is None:
+            return
         try:
-            if file_path.suffix == '.java':
-                self._process_java_file(file_path)
-            elif file_path.suffix == '.xml':
-                self._process_xml_file(file_path)
-            elif file_path.suffix == '.jsp':
-                self._process_jsp_file(file_path)
+            handler(self, file_path)
         except Exception as e:
             self.context.logger.error(f"Error processing {file_path}: {str(e)}")
             raise
 
     def _process_java_file(self, file_path: Path):
         """Process Java file"""
-        # Implementation from previous script
-        pass
-
+        self._apply_rewrites(file_path, self._java_rules)
 
     def _process_xml_file(self, file_path: Path):
         """Process XML file"""
-        # Implementation from previous script
-        pass
-
+        self._apply_rewrites(file_path, self._xml_rules)
 
     def _process_jsp_file(self, file_path: Path):
         """Process JSP file"""
-        # Implementation from previous script
-        pass
+        self._apply_rewrites(file_path, self._jsp_rules)
+
+    # Handler per file suffix; suffixes not listed are left untouched
+    _HANDLERS = {
+        '.java': _process_java_file,
+        '.xml': _process_xml_file,
+        '.jsp': _process_jsp_file,
+    }
+
+    def _apply_rewrites(self, file_path: Path, rules: List[Tuple[re.Pattern, bytes]]):
+        """Apply compiled rewrite rules to a file, writing it back only if it changed"""
+        if not rules:
+            return
+
+        # Rewrite a symlink's target rather than replacing the link with a regular file
+        file_path = Path(os.path.realpath(file_path))
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            stat = os.fstat(fd)
+            if stat.st_size == 0:
+                return
+            # The first rule scans the mapped file directly, without a separate read
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as content:
+                replaced = 0
+                for pattern, replacement in rules:
+                    content, count = pattern.subn(replacement, content)
+                    replaced += count
+        finally:
+            os.close(fd)
+
+        if replaced:
+            write_atomic(file_path, content, stat.st_mode)
+            self.context.logger.debug(f"Applied {replaced} rewrites to {file_path}")
 
 
 class MigrationManager:
     """Manages the overall migration process"""
     def __init__(self, config_file: str, base_dir: str):
+        base = Path(base_dir)
         self.config_manager = ConfigurationManager(config_file)
-        self.config_manager.update_paths(base_dir)
+        self.config_manager.update_paths(base)
        
         self.context = MigrationContext(
             config=self.config_manager.config,
             logger=LoggingManager.setup_logging(self.config_manager.config),
-            base_dir=Path(base_dir),
-            backup_dir=Path(base_dir) / self.config_manager.config['paths']['backup_dir']
+            base_dir=base,
+            backup_dir=self.config_manager.config['paths']['backup_dir']
         )
         self.path_manager = PathManager(self.context)
         self.file_processor = FileProcessor(self.context)
@@ -183,13 +454,14 @@ class MigrationManager:
 
     def execute_migration(self):
         """Execute the migration process"""
+        snapshot_dir = None
         try:
             # Validate environment
             self.path_manager.validate_paths()
             
             # Create backup if enabled
             if self.context.config['migration']['backup_enabled']:
-                self.path_manager.create_backup_directory()
+                snapshot_dir = self.path_manager.create_backup_directory()
                 
 
             # Process files
@@ -202,9 +474,12 @@ class MigrationManager:
             
         except Exception as e:
             self.context.logger.error(f"Migration failed: {str(e)}")
-            if self.context.config['migration']['rollback_enabled']:
-                self._rollback()
+            # Only roll back from the snapshot this run created
+            if self.context.config['migration']['rollback_enabled'] and snapshot_dir:
+                self._rollback(snapshot_dir)
             raise
+        finally:
+            LoggingManager.shutdown_logging(self.context.logger)
 
 
     def _generate_report(self):
@@ -223,20 +498,210 @@ class MigrationManager:
         with open(report_file, 'w') as f:
             json.dump(report, f, indent=2)
 
-    def _rollback(self):
-        """Rollback changes if enabled"""
-        if self.context.backup_dir.exists():
-            shutil.rmtree(self.context.base_dir)
-            shutil.copytree(self.context.backup_dir, self.context.base_dir)
-            self.context.logger.info("Rollback completed")
+    def _rollback(self, backup_dir: Path):
+        """Rollback changes by relinking files that no longer match the backup snapshot.
+
+        Only paths present in the snapshot are restored; files created in the
+        project after the snapshot are left in place.
+        """
+        if not backup_dir.exists():
+            return
+
+        restored = 0
+        for dir_path, dir_names, file_names in os.walk(backup_dir):
+            target_dir = self.context.base_dir / os.path.relpath(dir_path, backup_dir)
+            target_dir.mkdir(parents=True, exist_ok=True)
+            # os.walk lists symlinks to directories among dir_names without descending
+            link_names = [name for name in dir_names if os.path.islink(os.path.join(dir_path, name))]
+            for name in link_names + file_names:
+                backup_file = os.path.join(dir_path, name)
+                target_file = target_dir / name
+                if os.path.islink(backup_file):
+                    # Symlinks are backed up as links; restore the link itself
+                    link = os.readlink(backup_file)
+                    if os.path.islink(target_file) and os.readlink(target_file) == link:
+                        continue
+                    if os.path.lexists(target_file):
+                        target_file.unlink()
+                    os.symlink(link, target_file)
+                    restored += 1
+                    continue
+                try:
+                    # Unmodified files still share the backup's inode
+                    if os.path.samefile(backup_file, target_file):
+                        continue
+                    target_file.unlink()
+                except FileNotFoundError:
+                    pass
+                link_or_copy(backup_file, target_file)
+                restored += 1
+        self.context.logger.info(f"Rollback completed, {restored} files restored")
+
+
+def config_cache_dir() -> Path:
+    """Return the per-user directory holding parsed configuration caches"""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(cache_home) / 'struts_migration'
+
+
+def is_private_file(stat: os.stat_result) -> bool:
+    """Return True if a file is owned by the current user and not group/world-writable"""
+    if not hasattr(os, 'getuid'):
+        return True
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def available_cpus() -> List[int]:
+    """Return the CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_worker_to_cpu(cpus: List[int], worker_ids):
+    """Pin the calling worker process to one CPU, assigned round-robin"""
+    with worker_ids.get_lock():
+        worker_id = worker_ids.value
+        worker_ids.value += 1
+    os.sched_setaffinity(0, {cpus[worker_id % len(cpus)]})
+
+
+# FileProcessor owned by the current worker process, set by _init_worker
+_worker_processor: Optional[FileProcessor] = None
+
+
+def _init_worker(config: Dict[str, Any], base_dir: Path, backup_dir: Path,
+                 log_queue, cpus: List[int], worker_ids):
+    """Set up logging, CPU affinity and a FileProcessor in a worker process"""
+    global _worker_processor
+    logger = logging.getLogger('StrutsMigration')
+    logger.handlers.clear()
+    if log_queue is not None:
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        # Logging was shut down in the parent; errors still reach it via the futures
+        logger.addHandler(logging.NullHandler())
+    logger.setLevel(getattr(logging, config['logging']['level']))
+    if hasattr(os, 'sched_setaffinity'):
+        pin_worker_to_cpu(cpus, worker_ids)
+
+    context = MigrationContext(
+        config=config,
+        logger=logger,
+        base_dir=base_dir,
+        backup_dir=backup_dir
+    )
+    _worker_processor = FileProcessor(context)
+
+
+def _process_file_in_worker(file_path: Path):
+    """Process a single file with the worker process's FileProcessor"""
+    _worker_processor._process_file(file_path)
+
+
+def link_or_copy(src, dst):
+    """Hard link src to dst, falling back to a copy where links are unsupported"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def write_atomic(path: Path, data: bytes, mode: int):
+    """Write data to a temporary sibling and rename it over path"""
+    # The rename gives path a fresh inode, so backup hard links keep the old contents
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        try:
+            # chmod is not subject to the umask, unlike the mode passed to open
+            os.chmod(tmp_path, mode & 0o7777)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 def parse_size(size_str: str) -> int:
-    """Parse size string (e.g., '10MB') to bytes"""
-    units = {'B': 1, 'KB': 1024, 'MB': 1024*1024, 'GB': 1024*1024*1024}
-    number = int(''.join(filter(str.isdigit, size_str)))
-    unit = ''.join(filter(str.isalpha, size_str.upper()))
-    return number * units[unit]
+    """Parse size string (e.g., '10MB' or '1.5GB') to bytes"""
+    match = SIZE_PATTERN.match(size_str)
+    if not match:
+        raise ValueError(f"Invalid size: {size_str}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a '/'-separated glob (with '**' for any depth) to a regex string"""
+    parts = []
+    components = pattern.split('/')
+    for i, component in enumerate(components):
+        last = i == len(components) - 1
+        if component == '**':
+            parts.append('.*' if last else '(?:[^/]+/)*')
+            continue
+
+        j = 0
+        while j < len(component):
+            char = component[j]
+            if char == '*':
+                parts.append('[^/]*')
+            elif char == '?':
+                parts.append('[^/]')
+            elif char == '[' and component.find(']', j + 2) != -1:
+                end = component.find(']', j + 2)
+                body = component[j + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                j = end
+            else:
+                parts.append(re.escape(char))
+            j += 1
+        if not last:
+            parts.append('/')
+    return ''.join(parts)
+
+
+def is_within(path: str, directory: str) -> bool:
+    """Return True if path is directory or lies beneath it"""
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def has_glob_magic(pattern: str) -> bool:
+    """Return True if the pattern contains glob wildcard characters"""
+    return any(char in pattern for char in '*?[')
+
+
+def glob_literal_prefix(pattern: str) -> str:
+    """Return the leading directories of a glob that contain no wildcards, with trailing '/'"""
+    prefix = []
+    for component in pattern.split('/')[:-1]:
+        if has_glob_magic(component):
+            break
+        prefix.append(component + '/')
+    return ''.join(prefix)
+
+
+def compile_globs(patterns, anchored: bool = True) -> re.Pattern:
+    """Compile glob patterns into one regex matching any of them against relative paths.
+
+    Anchored patterns match from the base directory, like Path.glob. Unanchored
+    patterns match from the right, like Path.match, so '*Test.java' matches
+    'src/a/FooTest.java'.
+    """
+    if not patterns:
+        return re.compile('(?!)')
+    prefix = '' if anchored else '(?:.*/)?'
+    # pathlib globbing is case-insensitive on Windows
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return re.compile('|'.join(f'(?:{prefix}{glob_to_regex(p)})' for p in patterns), flags)
 
 
 def main():
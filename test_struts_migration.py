@@ -0,0 +1,170 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path, PurePosixPath
+from unittest import mock
+
+import yaml
+
+import struts_migration
+from struts_migration import (
+    FileProcessor,
+    MigrationContext,
+    MigrationManager,
+    PathManager,
+    compile_globs,
+)
+
+
+def write(path: Path, text: str = ''):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+class ProjectTestCase(unittest.TestCase):
+    """Builds a throwaway project tree for each test"""
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.base_dir = self.tmp / 'project'
+        write(self.base_dir / 'pom.xml', '<project/>')
+        write(self.base_dir / 'Root.java', 'class Root {}')
+        write(self.base_dir / 'src/main/java/com/x/A.java', 'class A {}')
+        write(self.base_dir / 'src/main/java/com/x/ATest.java', 'class ATest {}')
+        write(self.base_dir / 'src/main/resources/struts.xml', 'struts-2.5.dtd')
+        write(self.base_dir / 'src/main/webapp/index.jsp', '')
+        write(self.base_dir / 'target/classes/a/B.java', 'class B {}')
+
+    def make_processor(self, backup_dir='backup', rewrites=None) -> FileProcessor:
+        context = MigrationContext(
+            config={'patterns': {'rewrites': rewrites or {}}},
+            logger=logging.getLogger('StrutsMigrationTest'),
+            base_dir=self.base_dir,
+            backup_dir=self.base_dir / backup_dir
+        )
+        return FileProcessor(context)
+
+    def gather(self, include, exclude=(), **kwargs):
+        files = self.make_processor(**kwargs)._gather_files(list(include), list(exclude))
+        return sorted(f.relative_to(self.base_dir).as_posix() for f in files)
+
+
+class GlobMatchingTest(ProjectTestCase):
+    def test_includes_match_path_glob(self):
+        for pattern in ['**/*.java', 'src/main/java/**/*.java', 'src/*/*/struts.xml', '*.xml', 'pom.xml']:
+            expected = sorted(p.relative_to(self.base_dir).as_posix()
+                              for p in self.base_dir.glob(pattern) if p.is_file())
+            self.assertEqual(self.gather([pattern]), expected, pattern)
+
+    def test_excludes_match_from_the_right_like_path_match(self):
+        paths = ['src/a/FooTest.java', 'src/b.java', 'a/src/b.java', 'pom.xml', 'a/pom.xml', 'b/a/X.java']
+        for pattern in ['*Test.java', 'src/*.java', 'pom.xml', 'a/*.java', '*/pom.xml']:
+            regex = compile_globs([pattern], anchored=False)
+            for path in paths:
+                self.assertEqual(bool(regex.fullmatch(path)), PurePosixPath(path).match(pattern),
+                                 (pattern, path))
+
+    def test_double_star_exclude_spans_any_depth(self):
+        self.assertEqual(self.gather(['**/*.java'], ['**/target/**', '*Test.java']),
+                         ['Root.java', 'src/main/java/com/x/A.java'])
+
+
+class GatherFilesTest(ProjectTestCase):
+    def test_backup_directory_is_never_gathered(self):
+        write(self.base_dir / '.migration-backup/20240101_000000/pom.xml')
+        self.assertEqual(self.gather(['**/*.xml'], backup_dir='.migration-backup'),
+                         ['pom.xml', 'src/main/resources/struts.xml'])
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'symlinks unsupported')
+    def test_symlinked_files_are_gathered_once_and_not_followed_outside(self):
+        outside = self.tmp / 'outside.xml'
+        write(outside)
+        os.symlink(self.base_dir / 'pom.xml', self.base_dir / 'pom-link.xml')
+        os.symlink(outside, self.base_dir / 'outside.xml')
+        os.symlink('..', self.base_dir / 'src/up')
+        self.assertEqual(self.gather(['**/*.xml']), ['pom.xml', 'src/main/resources/struts.xml'])
+
+    def test_unreadable_directory_is_skipped(self):
+        locked = str(self.base_dir / 'src/main/java/com')
+        scandir = os.scandir
+
+        def fake_scandir(path):
+            if os.fspath(path) == locked:
+                raise PermissionError(13, 'Permission denied', locked)
+            return scandir(path)
+
+        with mock.patch.object(struts_migration.os, 'scandir', fake_scandir):
+            with self.assertLogs('StrutsMigrationTest', level='WARNING'):
+                files = self.gather(['**/*.java'], ['**/target/**'])
+        self.assertEqual(files, ['Root.java'])
+
+
+class RollbackTest(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        cache_home = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': str(self.tmp / 'cache')})
+        cache_home.start()
+        self.addCleanup(cache_home.stop)
+
+        with open(Path(__file__).parent / 'config.yaml', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        config['logging']['file'] = str(self.tmp / 'migration.log')
+        config['patterns']['rewrites'] = {'xml': [['2\\.5', '6.0']]}
+        self.config_file = self.tmp / 'config.yaml'
+        self.config_file.write_text(yaml.safe_dump(config))
+
+    def run_failing_migration(self):
+        manager = MigrationManager(str(self.config_file), str(self.base_dir))
+        process_files = manager.file_processor.process_files
+
+        def process_then_fail():
+            process_files()
+            raise RuntimeError('forced failure')
+
+        manager.file_processor.process_files = process_then_fail
+        with self.assertRaises(RuntimeError):
+            manager.execute_migration()
+        return manager
+
+    def test_failed_migration_restores_rewritten_files(self):
+        struts_xml = self.base_dir / 'src/main/resources/struts.xml'
+        self.run_failing_migration()
+
+        self.assertEqual(struts_xml.read_text(), 'struts-2.5.dtd')
+        snapshot, = (self.base_dir / 'backup').iterdir()
+        self.assertTrue(os.path.samefile(struts_xml, snapshot / 'src/main/resources/struts.xml'))
+        self.assertTrue(os.path.samefile(self.base_dir / 'pom.xml', snapshot / 'pom.xml'))
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'symlinks unsupported')
+    def test_rollback_keeps_symlinks(self):
+        shared = self.base_dir / 'shared/struts.xml'
+        struts_xml = self.base_dir / 'src/main/resources/struts.xml'
+        shared.parent.mkdir()
+        shutil.move(struts_xml, shared)
+        os.symlink('../../../shared/struts.xml', struts_xml)
+        os.symlink('..', self.base_dir / 'src/up')
+
+        self.run_failing_migration()
+
+        self.assertEqual(os.readlink(struts_xml), '../../../shared/struts.xml')
+        self.assertEqual(os.readlink(self.base_dir / 'src/up'), '..')
+        self.assertEqual(shared.read_text(), 'struts-2.5.dtd')
+
+    def test_each_run_gets_its_own_snapshot(self):
+        manager = MigrationManager(str(self.config_file), str(self.base_dir))
+        path_manager = PathManager(manager.context)
+        with mock.patch.object(struts_migration, 'datetime') as clock:
+            clock.now.return_value.strftime.side_effect = ['20240101_000000', '20240101_000001']
+            first = path_manager.create_backup_directory()
+            second = path_manager.create_backup_directory()
+        struts_migration.LoggingManager.shutdown_logging(manager.context.logger)
+
+        self.assertNotEqual(first, second)
+        self.assertTrue((first / 'pom.xml').exists())
+        self.assertFalse((second / first.name).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()